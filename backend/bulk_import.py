@@ -0,0 +1,294 @@
+"""Offline bulk importer for seeding users, connections and posts.
+
+Reads CSV or NDJSON (by file extension) and writes straight to MongoDB with
+unordered batched inserts, bypassing the API. Passwords are bcrypt-hashed in
+a process pool unless the rows already carry a `password_hash`. Users whose
+username or email already exists (in the DB or earlier in the file) are
+skipped and counted as errors, as are rows whose `created_at` isn't ISO
+formatted.
+
+    python bulk_import.py --users users.csv [--connections edges.csv] [--posts posts.ndjson]
+
+users:       username, email, password | password_hash, full_name, profession,
+             bio, location, [id], [created_at]
+connections: user, other        (usernames or ids; stored on both sides)
+posts:       user, content, [id], [created_at]
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+
+import bcrypt
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from storage import new_id, now, ref, match_any, encode, decode
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def read_rows(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(rows, size: int):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def hash_password(args):
+    password, rounds = args
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+class Progress:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def report(self, final: bool = False):
+        elapsed = time.monotonic() - self.started
+        rate = self.rows / elapsed if elapsed else 0.0
+        label = "done" if final else "..."
+        print(f"{self.name} {label} {self.rows} rows, {self.errors} errors, "
+              f"{elapsed:.1f}s, {rate:.0f} rows/sec", flush=True)
+
+
+def insert_batch(collection, docs, progress: Progress):
+    try:
+        result = collection.insert_many(docs, ordered=False)
+        progress.rows += len(result.inserted_ids)
+    except BulkWriteError as e:
+        progress.rows += e.details.get("nInserted", 0)
+        progress.errors += len(e.details.get("writeErrors", []))
+
+
+class UserIds:
+    """Resolves usernames or ids to user ids, caching lookups."""
+
+    def __init__(self, db):
+        self.db = db
+        self.ids = {}
+
+    def add(self, username: str, user_id: str):
+        self.ids[username] = user_id
+        self.ids[user_id] = user_id
+
+    def resolve(self, keys):
+        missing = [k for k in set(keys) if k not in self.ids]
+        if missing:
+            cursor = self.db.users.find(
+                {"$or": [{"username": {"$in": missing}}, {"id": match_any(missing)}]},
+                {"_id": 0, "id": 1, "username": 1},
+            )
+            for doc in cursor:
+                doc = decode(doc)
+                self.add(doc["username"], doc["id"])
+        return {k: self.ids.get(k) for k in keys}
+
+
+def new_user_rows(batch, taken_usernames: set, taken_emails: set):
+    """Keep complete rows whose username and email are not taken yet.
+
+    Accepted rows are marked as taken, so duplicates later in the file are
+    rejected too.
+    """
+    rows, rejected = [], 0
+    for row in batch:
+        username, email = row.get("username"), row.get("email")
+        if (not username or not email or not (row.get("password") or row.get("password_hash"))
+                or username in taken_usernames or email in taken_emails):
+            rejected += 1
+            continue
+        taken_usernames.add(username)
+        taken_emails.add(email)
+        rows.append(row)
+    return rows, rejected
+
+
+def created_at(value) -> str:
+    """Normalise an optional created_at to an aware UTC ISO string.
+
+    Naive times are taken as UTC. Raises ValueError for anything that isn't
+    ISO formatted, which ranking and compact storage can't handle later.
+    """
+    if not value:
+        return now()
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def user_doc(row: dict, password_hash: str) -> dict:
+    # CSV rows have None for missing trailing columns; the API expects strings
+    return {
+        "id": row.get("id") or new_id(),
+        "username": row["username"],
+        "email": row["email"],
+        "password": password_hash,
+        "full_name": row.get("full_name") or "",
+        "profession": row.get("profession") or "",
+        "bio": row.get("bio") or "",
+        "location": row.get("location") or "",
+        "avatar_url": None,
+        "created_at": created_at(row.get("created_at")),
+        "connections": [],
+        "pending_requests": []
+    }
+
+
+def import_users(db, path: str, user_ids: UserIds, batch_size: int, workers: int, rounds: int):
+    progress = Progress("users")
+    taken_usernames, taken_emails = set(), set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(read_rows(path), batch_size):
+            # Like /auth/register, refuse usernames and emails already in use
+            existing = db.users.find(
+                {"$or": [
+                    {"username": {"$in": [row.get("username") for row in batch]}},
+                    {"email": {"$in": [row.get("email") for row in batch]}}
+                ]},
+                {"_id": 0, "username": 1, "email": 1},
+            )
+            for doc in existing:
+                taken_usernames.add(doc["username"])
+                taken_emails.add(doc["email"])
+            rows, rejected = new_user_rows(batch, taken_usernames, taken_emails)
+            progress.errors += rejected
+
+            to_hash = [(row["password"], rounds) for row in rows if not row.get("password_hash")]
+            hashes = iter(pool.map(hash_password, to_hash, chunksize=max(1, len(to_hash) // (workers * 4))))
+
+            docs = []
+            for row in rows:
+                password_hash = row.get("password_hash") or next(hashes)
+                try:
+                    user = user_doc(row, password_hash)
+                except ValueError:
+                    # e.g. a created_at that isn't ISO formatted
+                    progress.errors += 1
+                    continue
+                user_ids.add(user["username"], user["id"])
+                docs.append(encode(user))
+            if docs:
+                insert_batch(db.users, docs, progress)
+            progress.report()
+    progress.report(final=True)
+    return progress
+
+
+def import_connections(db, path: str, user_ids: UserIds, batch_size: int):
+    progress = Progress("connections")
+    for batch in batched(read_rows(path), batch_size):
+        resolved = user_ids.resolve([row["user"] for row in batch] + [row["other"] for row in batch])
+
+        # Group both directions of every edge so each user gets one update per batch
+        adjacency = defaultdict(set)
+        for row in batch:
+            a, b = resolved[row["user"]], resolved[row["other"]]
+            if not a or not b or a == b:
+                progress.errors += 1
+                continue
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+            progress.rows += 1
+
+        ops = [
+            UpdateOne({"id": ref(user_id)}, {"$addToSet": {"connections": {"$each": [ref(o) for o in others]}}})
+            for user_id, others in adjacency.items()
+        ]
+        if ops:
+            db.users.bulk_write(ops, ordered=False)
+        progress.report()
+    progress.report(final=True)
+    return progress
+
+
+def import_posts(db, path: str, user_ids: UserIds, batch_size: int):
+    progress = Progress("posts")
+    usernames = {}
+    for batch in batched(read_rows(path), batch_size):
+        resolved = user_ids.resolve([row["user"] for row in batch])
+        unknown = [uid for uid in set(resolved.values()) if uid and uid not in usernames]
+        if unknown:
+            for doc in db.users.find({"id": match_any(unknown)}, {"_id": 0, "id": 1, "username": 1}):
+                doc = decode(doc)
+                usernames[doc["id"]] = doc["username"]
+
+        docs = []
+        for row in batch:
+            user_id = resolved[row["user"]]
+            # The id may be cached from an earlier batch whose insert failed
+            if not user_id or user_id not in usernames:
+                progress.errors += 1
+                continue
+            try:
+                post_created_at = created_at(row.get("created_at"))
+            except ValueError:
+                progress.errors += 1
+                continue
+            docs.append(encode({
+                "id": row.get("id") or new_id(),
+                "user_id": user_id,
+                "username": usernames[user_id],
+                "content": row["content"],
+                "created_at": post_created_at,
+                "likes": [],
+                "comments": []
+            }))
+        if docs:
+            insert_batch(db.posts, docs, progress)
+        progress.report()
+    progress.report(final=True)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users, connections and posts")
+    parser.add_argument("--users", help="CSV or NDJSON file of users")
+    parser.add_argument("--connections", help="CSV or NDJSON file of user/other pairs")
+    parser.add_argument("--posts", help="CSV or NDJSON file of posts")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--bcrypt-rounds", type=int, default=12,
+                        help="Lower values speed up seeding of throwaway environments")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    user_ids = UserIds(db)
+
+    if args.users:
+        import_users(db, args.users, user_ids, args.batch_size, args.workers, args.bcrypt_rounds)
+    if args.connections:
+        import_connections(db, args.connections, user_ids, args.batch_size)
+    if args.posts:
+        import_posts(db, args.posts, user_ids, args.batch_size)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
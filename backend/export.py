@@ -0,0 +1,178 @@
+"""Streaming NDJSON export of a user's profile, network and activity.
+
+Every collection is read through a cursor with a bounded batch size and
+written out chunk by chunk, so memory per export stays constant regardless
+of how much data the user has.
+
+    python export.py <user_id> [-o export.ndjson.gz] [--gzip]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Optional
+
+from starlette.responses import StreamingResponse
+
+from storage import match, match_any, decode
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Throughput cap per export so large exports don't starve interactive traffic
+EXPORT_RATE_BYTES = int(os.environ.get("EXPORT_RATE_BYTES", str(2 * 1024 * 1024)))
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", "2"))
+
+
+class ExportSlots:
+    """Counts exports in progress on this worker.
+
+    try_acquire checks and reserves in one step (there is no await in
+    between), so concurrent requests can't all slip past the limit.
+    """
+
+    def __init__(self, limit: int = EXPORT_MAX_CONCURRENT):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self) -> Optional[Callable[[], None]]:
+        """Reserve a slot; returns its release callback, or None if full.
+
+        The callback may be called any number of times but frees the slot
+        only once.
+        """
+        if self.active >= self.limit:
+            return None
+        self.active += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.active -= 1
+        return release
+
+
+class ExportResponse(StreamingResponse):
+    """Streaming response that frees its export slot however it ends.
+
+    A generator's finally never runs if the client disconnects before the
+    first chunk is requested, so the release hangs off the response itself.
+    """
+
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+export_slots = ExportSlots()
+
+
+async def iter_records(db, user_id: str):
+    user = await db.users.find_one({"id": match(user_id)}, {"_id": 0, "password": 0})
+    if not user:
+        return
+    user = decode(user)
+    yield {"type": "user", "data": user}
+
+    # Connections in slices so a huge network never becomes one big $in
+    for ids, kind in ((user.get("connections", []), "connection"), (user.get("pending_requests", []), "pending_request")):
+        for start in range(0, len(ids), EXPORT_BATCH_SIZE):
+            cursor = db.users.find(
+                {"id": match_any(ids[start:start + EXPORT_BATCH_SIZE])},
+                {"_id": 0, "id": 1, "username": 1, "full_name": 1, "profession": 1},
+            )
+            async for doc in cursor:
+                yield {"type": kind, "data": decode(doc)}
+
+    cursor = db.posts.find({"user_id": match(user_id)}, {"_id": 0}).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield {"type": "post", "data": decode(doc)}
+
+    cursor = db.messages.find(
+        {"$or": [{"sender_id": match(user_id)}, {"receiver_id": match(user_id)}]},
+        {"_id": 0},
+    ).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield {"type": "message", "data": decode(doc)}
+
+
+async def stream_export(db, user_id: str, compress: bool = False, rate: int = EXPORT_RATE_BYTES):
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    buffered = 0
+    started = time.monotonic()
+    sent = 0
+
+    async def flush():
+        nonlocal buffer, buffered, sent
+        chunk = "".join(buffer).encode("utf-8")
+        buffer, buffered = [], 0
+        if compressor:
+            chunk = compressor.compress(chunk)
+        sent += len(chunk)
+        # Sleep off any lead over the configured rate
+        if rate:
+            ahead = sent / rate - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        return chunk
+
+    async for record in iter_records(db, user_id):
+        line = json.dumps(record, default=str) + "\n"
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= EXPORT_CHUNK_BYTES:
+            chunk = await flush()
+            if chunk:
+                yield chunk
+
+    chunk = await flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+async def export_to_file(user_id: str, output, compress: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        # No throttling offline; the CLI is not competing with a worker's requests
+        async for chunk in stream_export(db, user_id, compress=compress, rate=0):
+            output.write(chunk)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a user's data as NDJSON")
+    parser.add_argument("user_id")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    compress = args.gzip or (args.output or "").endswith(".gz")
+    if args.output:
+        with open(args.output, "wb") as output:
+            asyncio.run(export_to_file(args.user_id, output, compress))
+    else:
+        asyncio.run(export_to_file(args.user_id, sys.stdout.buffer, compress))
+
+
+if __name__ == "__main__":
+    main()
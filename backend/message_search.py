@@ -0,0 +1,179 @@
+import os
+import re
+import math
+import heapq
+import bisect
+import asyncio
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from storage import match, match_any, since, decode
+
+MESSAGE_SEARCH_MAX_DOCS = int(os.environ.get("MESSAGE_SEARCH_MAX_DOCS", "1000000"))
+BUILD_BATCH_SIZE = 2000
+# Catch-up re-reads this far behind the watermark, since a message stamped
+# earlier can become visible after a later one written by another worker
+CATCHUP_OVERLAP = timedelta(seconds=30)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower() for t in TOKEN_RE.findall(text)]
+
+
+class UserMessageIndex:
+    """Inverted index over one user's messages (sent and received)."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.others: List[str] = []
+        self.created: List[str] = []
+        # (created_at, doc) per conversation, kept sorted: catch-up can index
+        # an older message after newer ones arrived through on_message
+        self.conversations: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.seen = set()
+        # Newest created_at read back from the database; only the catch-up
+        # query moves it, never messages indexed through on_message
+        self.caught_up_to = ""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, message: dict, user_id: str):
+        if message["id"] in self.seen:
+            return
+        doc = len(self.ids)
+        other = message["receiver_id"] if message["sender_id"] == user_id else message["sender_id"]
+        self.ids.append(message["id"])
+        self.others.append(other)
+        self.created.append(message["created_at"])
+        bisect.insort(self.conversations[other], (message["created_at"], doc))
+        for term in tokenize(message["content"]):
+            postings = self.postings[term]
+            postings[doc] = postings.get(doc, 0) + 1
+        self.seen.add(message["id"])
+
+    def search(self, terms: List[str], offset: int, limit: int) -> Tuple[int, List[Tuple[float, int]]]:
+        lists = [self.postings.get(t) for t in set(terms)]
+        if not lists or any(not p for p in lists):
+            return 0, []
+        # Every term must match; intersect starting from the rarest
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for postings in lists[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                return 0, []
+
+        n = len(self.ids)
+        idf = [math.log(1 + n / len(p)) for p in lists]
+        scored = (
+            (sum((1 + math.log(p[doc])) * w for p, w in zip(lists, idf)), doc)
+            for doc in candidates
+        )
+        # Ties favour the newer message
+        best = heapq.nlargest(offset + limit, scored, key=lambda hit: (hit[0], self.created[hit[1]], hit[1]))
+        return len(candidates), best[offset:]
+
+    def context(self, doc: int, size: int) -> List[int]:
+        conversation = self.conversations[self.others[doc]]
+        position = bisect.bisect_left(conversation, (self.created[doc], doc))
+        return [d for _, d in conversation[max(0, position - size):position + size + 1]]
+
+
+class MessageSearch:
+    """Per-user message indexes, built lazily and kept in an LRU."""
+
+    def __init__(self, db, max_docs: int = MESSAGE_SEARCH_MAX_DOCS):
+        self.db = db
+        self.max_docs = max_docs
+        self.indexes: "OrderedDict[str, UserMessageIndex]" = OrderedDict()
+        self.locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.total_docs = 0
+        self.indexed = False
+
+    def on_message(self, message: dict):
+        """Index a just-sent message for whichever participants are loaded."""
+        for user_id in (message["sender_id"], message["receiver_id"]):
+            index = self.indexes.get(user_id)
+            if index is not None:
+                before = len(index)
+                index.add(message, user_id)
+                self.total_docs += len(index) - before
+
+    async def _ensure_indexes(self):
+        if not self.indexed:
+            await self.db.messages.create_index([("sender_id", 1), ("created_at", 1)])
+            await self.db.messages.create_index([("receiver_id", 1), ("created_at", 1)])
+            await self.db.messages.create_index("id")
+            self.indexed = True
+
+    async def _index_for(self, user_id: str) -> UserMessageIndex:
+        await self._ensure_indexes()
+        async with self.locks[user_id]:
+            index = self.indexes.get(user_id)
+            if index is None:
+                index = UserMessageIndex()
+                self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+
+            # Catch up on anything written since the last search, including
+            # messages sent through other workers
+            query = {"$or": [{"sender_id": match(user_id)}, {"receiver_id": match(user_id)}]}
+            if index.caught_up_to:
+                start = datetime.fromisoformat(index.caught_up_to) - CATCHUP_OVERLAP
+                query = {"$and": [query, since("created_at", start.isoformat())]}
+            cursor = self.db.messages.find(
+                query,
+                {"_id": 0, "id": 1, "sender_id": 1, "receiver_id": 1, "content": 1, "created_at": 1},
+            ).sort("created_at", 1).batch_size(BUILD_BATCH_SIZE)
+            before = len(index)
+            async for message in cursor:
+                message = decode(message)
+                index.add(message, user_id)
+                index.caught_up_to = max(index.caught_up_to, message["created_at"])
+            self.total_docs += len(index) - before
+
+        self._evict(keep=user_id)
+        return index
+
+    def _evict(self, keep: str):
+        while self.total_docs > self.max_docs and len(self.indexes) > 1:
+            user_id, index = next(iter(self.indexes.items()))
+            if user_id == keep:
+                self.indexes.move_to_end(user_id)
+                continue
+            del self.indexes[user_id]
+            self.locks.pop(user_id, None)
+            self.total_docs -= len(index)
+
+    async def search(self, user_id: str, query: str, offset: int = 0, limit: int = 20, context: int = 0) -> dict:
+        terms = tokenize(query)
+        if not terms:
+            return {"total": 0, "results": []}
+        index = await self._index_for(user_id)
+        total, hits = index.search(terms, offset, limit)
+
+        # Load the page (and its context) fresh so read flags are current
+        wanted = {doc: index.context(doc, context) if context else [doc] for _, doc in hits}
+        ids = {index.ids[d] for docs in wanted.values() for d in docs}
+        messages = {}
+        if ids:
+            found = await self.db.messages.find({"id": match_any(ids)}, {"_id": 0}).to_list(len(ids))
+            messages = {m["id"]: m for m in decode(found)}
+
+        results = []
+        for score, doc in hits:
+            message = messages.get(index.ids[doc])
+            if message is None:
+                continue
+            results.append({
+                "message": message,
+                "other_user_id": index.others[doc],
+                "score": round(score, 4),
+                "context": [messages[index.ids[d]] for d in wanted[doc] if d != doc and index.ids[d] in messages],
+            })
+        return {"total": total, "results": results}
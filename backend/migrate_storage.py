@@ -0,0 +1,110 @@
+"""Convert existing collections to the compact storage format.
+
+Runs online: documents are rewritten in batches with an optimistic filter on
+their original values, so anything modified concurrently is simply picked up
+again on the next pass. Safe to interrupt and re-run.
+
+    python migrate_storage.py [--batch-size 1000] [--dry-run]
+
+Set STORAGE_FORMAT=compact on the API workers before (or while) this runs so
+new writes already use the compact form.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import bson
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from storage import REF_FIELDS, REF_LIST_FIELDS, DATE_FIELDS, encode
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+COLLECTIONS = ["users", "posts", "messages"]
+CONVERTED_FIELDS = REF_FIELDS | REF_LIST_FIELDS | DATE_FIELDS | {"comments"}
+
+
+def migrate_collection(collection, batch_size: int, dry_run: bool):
+    stats = {"scanned": 0, "converted": 0, "conflicts": 0, "errors": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(collection.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        for doc in batch:
+            stats["scanned"] += 1
+            try:
+                compact = encode(doc, compact=True)
+            except ValueError:
+                # e.g. a created_at that isn't ISO formatted; leave it as is
+                stats["errors"] += 1
+                continue
+            if compact == doc:
+                continue
+            stats["bytes_before"] += len(bson.encode(doc))
+            stats["bytes_after"] += len(bson.encode(compact))
+            fields = [f for f in CONVERTED_FIELDS if f in doc]
+            # Only replace the values we read; concurrent edits make this miss
+            condition = {"_id": doc["_id"]}
+            condition.update({f: doc[f] for f in fields})
+            ops.append(UpdateOne(condition, {"$set": {f: compact[f] for f in fields}}))
+
+        if ops and not dry_run:
+            result = collection.bulk_write(ops, ordered=False)
+            stats["converted"] += result.modified_count
+            stats["conflicts"] += len(ops) - result.matched_count
+        else:
+            stats["converted"] += len(ops)
+    return stats
+
+
+def collection_size(db, name: str):
+    info = db.command("collStats", name)
+    return info.get("size", 0), info.get("totalIndexSize", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate collections to the compact storage format")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Report savings without writing")
+    parser.add_argument("--max-passes", type=int, default=5, help="Re-scan while concurrent edits conflict")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    for name in COLLECTIONS:
+        size_before, index_before = collection_size(db, name)
+        started = time.monotonic()
+        totals = {}
+        for _ in range(args.max_passes):
+            stats = migrate_collection(db[name], args.batch_size, args.dry_run)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+            if args.dry_run or stats["conflicts"] == 0:
+                break
+        elapsed = time.monotonic() - started
+
+        saved = totals["bytes_before"] - totals["bytes_after"]
+        pct = 100.0 * saved / totals["bytes_before"] if totals["bytes_before"] else 0.0
+        print(f"{name}: scanned {totals['scanned']}, converted {totals['converted']}, "
+              f"conflicts {totals['conflicts']}, errors {totals['errors']} in {elapsed:.1f}s")
+        print(f"  document bytes {totals['bytes_before']} -> {totals['bytes_after']} "
+              f"(saved {saved} bytes, {pct:.1f}%)")
+        if not args.dry_run:
+            size_after, index_after = collection_size(db, name)
+            print(f"  collection size {size_before} -> {size_after}, "
+                  f"index size {index_before} -> {index_after}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import io
+import os
+import re
+import sys
+import time
+import asyncio
+import marshal
+import pstats
+import cProfile
+import threading
+import traceback
+from collections import Counter, deque
+from typing import Optional
+
+PROFILE_MAX_SECONDS = 120
+SAMPLE_INTERVAL = 0.005
+LOOP_MONITOR_INTERVAL = 0.1
+LOOP_BLOCK_THRESHOLD = float(os.environ.get("LOOP_BLOCK_THRESHOLD", "0.1"))
+
+
+def collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Profiler:
+    """On-demand CPU profiling of the event loop thread.
+
+    Nothing runs unless a capture is in progress: the middleware checks a
+    single attribute per request and the sampler thread only exists for the
+    duration of a capture.
+    """
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.route: Optional[re.Pattern] = None
+        self.profile: Optional[cProfile.Profile] = None
+        self.in_flight = 0
+        self.samples: Counter = Counter()
+        self.loop_thread_id: Optional[int] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    def sampling(self) -> bool:
+        return self.route is None or self.in_flight > 0
+
+    def request_started(self):
+        self.in_flight += 1
+        if self.profile is not None and self.in_flight == 1:
+            self.profile.enable()
+
+    def request_finished(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        if self.profile is not None and self.in_flight == 0:
+            self.profile.disable()
+
+    def _sample(self, stop: threading.Event):
+        while not stop.wait(SAMPLE_INTERVAL):
+            if not self.sampling():
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                self.samples[collapse(frame)] += 1
+
+    async def capture(self, seconds: float, mode: str, route: Optional[str], raw: bool = False):
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        async with self.lock:
+            self.loop_thread_id = threading.get_ident()
+            self.samples = Counter()
+            self.in_flight = 0
+            self.route = re.compile(route) if route else None
+            stop = threading.Event()
+            sampler = None
+            try:
+                if mode == "sample":
+                    sampler = threading.Thread(target=self._sample, args=(stop,), daemon=True)
+                    sampler.start()
+                else:
+                    self.profile = cProfile.Profile()
+                    if self.route is None:
+                        self.profile.enable()
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                if sampler is not None:
+                    sampler.join()
+                profile, self.profile = self.profile, None
+                if profile is not None:
+                    profile.disable()
+                self.route = None
+
+        # None when nothing was captured, e.g. no request matched the route
+        if mode == "sample":
+            if not self.samples:
+                return None
+            return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+        profile.create_stats()
+        if not profile.stats:
+            return None
+        if raw:
+            return marshal.dumps(profile.stats)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(50)
+        return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """Marks requests matching the capture's route filter as in flight."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        route = self.profiler.route
+        if route is None or scope["type"] != "http" or not route.search(scope["path"]):
+            return await self.app(scope, receive, send)
+        self.profiler.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_finished()
+
+
+class LoopMonitor:
+    """Measures event loop lag and records stacks of long-blocking callbacks.
+
+    A task on the loop updates a heartbeat; a watchdog thread notices when the
+    heartbeat stalls and grabs the loop thread's stack while it is blocked.
+    """
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.threshold = threshold
+        self.task: Optional[asyncio.Task] = None
+        self.stop_event = threading.Event()
+        self.heartbeat = 0.0
+        self.lags = deque(maxlen=600)
+        self.blocks = deque(maxlen=50)
+        self.loop_thread_id: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.task is not None
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stop_event = threading.Event()
+        self.task = asyncio.create_task(self._tick())
+        threading.Thread(target=self._watch, args=(self.stop_event,), daemon=True).start()
+
+    def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task = None
+        self.stop_event.set()
+
+    async def _tick(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL)
+            self.heartbeat = time.monotonic()
+            self.lags.append(self.heartbeat - started - LOOP_MONITOR_INTERVAL)
+
+    def _watch(self, stop: threading.Event):
+        reported = None
+        while not stop.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - LOOP_MONITOR_INTERVAL
+            if stalled < self.threshold:
+                if reported is not None:
+                    reported["blocked_seconds"] = round(self.heartbeat - reported["_since"] - LOOP_MONITOR_INTERVAL, 4)
+                    reported = None
+                continue
+            if reported is None:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                reported = {
+                    "_since": heartbeat,
+                    "at": time.time(),
+                    "blocked_seconds": round(stalled, 4),
+                    "stack": "".join(traceback.format_stack(frame)) if frame else "",
+                }
+                self.blocks.append(reported)
+
+    def report(self) -> dict:
+        lags = sorted(self.lags)
+        def pct(p):
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))], 4) if lags else 0.0
+        return {
+            "enabled": self.enabled,
+            "threshold_seconds": self.threshold,
+            "lag_seconds": {"p50": pct(0.5), "p99": pct(0.99), "max": round(lags[-1], 4) if lags else 0.0},
+            "blocking_callbacks": [
+                {k: v for k, v in block.items() if not k.startswith("_")} for block in reversed(self.blocks)
+            ],
+        }
@@ -0,0 +1,210 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from storage import match_any, since, decode
+
+logger = logging.getLogger(__name__)
+
+TRENDING_CAPACITY = int(os.environ.get("TRENDING_CAPACITY", "50000"))
+TRENDING_WINDOW_HOURS = float(os.environ.get("TRENDING_WINDOW_HOURS", "72"))
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "12"))
+TRENDING_RELOAD_SECONDS = float(os.environ.get("TRENDING_RELOAD_SECONDS", "300"))
+RESCORE_INTERVAL_SECONDS = 5.0
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+
+def to_timestamp(created_at: str) -> float:
+    return datetime.fromisoformat(created_at).timestamp()
+
+
+def decay_scores(likes, comments, created, now: float, half_life_hours: float = TRENDING_HALF_LIFE_HOURS):
+    # Engagement halves in weight every half-life; +1 lets fresh posts with no
+    # engagement still order by recency
+    age_hours = np.maximum(now - created, 0.0) / 3600.0
+    engagement = 1.0 + LIKE_WEIGHT * likes + COMMENT_WEIGHT * comments
+    return (engagement * np.exp2(-age_hours / half_life_hours)).astype(np.float32)
+
+
+def rank_posts(posts: List[dict]) -> List[dict]:
+    """Order already-loaded posts by decayed engagement score."""
+    if not posts:
+        return posts
+    likes = np.fromiter((len(p.get("likes", [])) for p in posts), dtype=np.float32, count=len(posts))
+    comments = np.fromiter((len(p.get("comments", [])) for p in posts), dtype=np.float32, count=len(posts))
+    created = np.fromiter((to_timestamp(p["created_at"]) for p in posts), dtype=np.float64, count=len(posts))
+    order = np.argsort(-decay_scores(likes, comments, created, time.time()), kind="stable")
+    return [posts[i] for i in order]
+
+
+class TrendingIndex:
+    """Engagement counters for the hot window of recent posts.
+
+    Posts occupy fixed slots in preallocated arrays, so memory is bounded by
+    the capacity. Scores are recomputed for all slots at once, at most every
+    RESCORE_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, capacity: int = TRENDING_CAPACITY, window_hours: float = TRENDING_WINDOW_HOURS):
+        self.capacity = capacity
+        self.window = window_hours * 3600.0
+        # Updates seen while load() is awaiting the database, replayed on
+        # top of the fresh snapshot so they aren't lost
+        self._pending: Optional[list] = None
+        self._reset()
+
+    def _reset(self):
+        capacity = self.capacity
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.likes = np.zeros(capacity, dtype=np.int32)
+        self.comments = np.zeros(capacity, dtype=np.int32)
+        self.profession = np.full(capacity, -1, dtype=np.int32)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.scores = np.zeros(capacity, dtype=np.float32)
+        self.slots: Dict[str, int] = {}
+        self.post_ids: List[Optional[str]] = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.professions: Dict[str, int] = {}
+        self.scored_at = 0.0
+
+    def _profession_code(self, profession: str) -> int:
+        if profession not in self.professions:
+            self.professions[profession] = len(self.professions)
+        return self.professions[profession]
+
+    def add(self, post_id: str, created_at: str, profession: str, likes: int = 0, comments: int = 0):
+        if self._pending is not None:
+            self._pending.append((self.add, (post_id, created_at, profession, likes, comments)))
+        created = to_timestamp(created_at)
+        if created < time.time() - self.window:
+            return
+        slot = self.slots.get(post_id)
+        if slot is None:
+            if not self.free:
+                self._evict()
+            slot = self.free.pop()
+            self.slots[post_id] = slot
+            self.post_ids[slot] = post_id
+        self.created[slot] = created
+        self.likes[slot] = likes
+        self.comments[slot] = comments
+        self.profession[slot] = self._profession_code(profession)
+        self.used[slot] = True
+        self.scores[slot] = decay_scores(likes, comments, created, time.time())
+
+    def remove(self, post_id: str):
+        if self._pending is not None:
+            self._pending.append((self.remove, (post_id,)))
+        slot = self.slots.pop(post_id, None)
+        if slot is None:
+            return
+        self.used[slot] = False
+        self.scores[slot] = 0.0
+        self.post_ids[slot] = None
+        self.free.append(slot)
+
+    def record_like(self, post_id: str, delta: int):
+        if self._pending is not None:
+            self._pending.append((self.record_like, (post_id, delta)))
+        slot = self.slots.get(post_id)
+        if slot is not None:
+            self.likes[slot] = max(0, self.likes[slot] + delta)
+
+    def record_comment(self, post_id: str):
+        if self._pending is not None:
+            self._pending.append((self.record_comment, (post_id,)))
+        slot = self.slots.get(post_id)
+        if slot is not None:
+            self.comments[slot] += 1
+
+    def rescore(self, force: bool = False):
+        now = time.time()
+        if not force and now - self.scored_at < RESCORE_INTERVAL_SECONDS:
+            return
+        self.scored_at = now
+        for slot in np.flatnonzero(self.used & (self.created < now - self.window)):
+            self.remove(self.post_ids[slot])
+        self.scores = np.where(self.used, decay_scores(self.likes, self.comments, self.created, now), 0.0).astype(np.float32)
+
+    def _evict(self):
+        # Window is full: drop the lowest scoring post to make room
+        self.rescore(force=True)
+        if self.free:
+            return
+        candidates = np.where(self.used, self.scores, np.inf)
+        self.remove(self.post_ids[int(np.argmin(candidates))])
+
+    def top(self, limit: int, profession: Optional[str] = None) -> List[str]:
+        self.rescore()
+        mask = self.used
+        if profession is not None:
+            code = self.professions.get(profession)
+            if code is None:
+                return []
+            mask = mask & (self.profession == code)
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        scores = self.scores[candidates]
+        if candidates.size > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            best = np.arange(candidates.size)
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.post_ids[i] for i in candidates[best]]
+
+    async def load(self, db):
+        """Rebuild counters for the window from the database."""
+        self._pending = []
+        try:
+            posts, professions = await self._fetch(db)
+        except BaseException:
+            self._pending = None
+            raise
+
+        pending, self._pending = self._pending, None
+        self._reset()
+        for p in posts:
+            self.add(p["id"], p["created_at"], professions.get(p["user_id"], ""), p["like_count"], p["comment_count"])
+        # An update may already be in the snapshot and get counted twice;
+        # the next reload corrects that, whereas dropping it would not
+        for method, args in pending:
+            if method == self.add and args[0] in self.slots:
+                continue
+            method(*args)
+        self.rescore(force=True)
+
+    async def _fetch(self, db):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.window)
+        cursor = db.posts.find(
+            since("created_at", cutoff.isoformat()),
+            {"_id": 0, "id": 1, "user_id": 1, "created_at": 1,
+             "like_count": {"$size": "$likes"}, "comment_count": {"$size": "$comments"}},
+        ).sort("created_at", -1).limit(self.capacity).batch_size(2000)
+        posts = [decode(p) for p in await cursor.to_list(self.capacity)]
+
+        author_ids = list({p["user_id"] for p in posts})
+        professions = {}
+        for start in range(0, len(author_ids), 1000):
+            users = await db.users.find(
+                {"id": match_any(author_ids[start:start + 1000])}, {"_id": 0, "id": 1, "profession": 1}
+            ).to_list(None)
+            professions.update((u["id"], u["profession"]) for u in decode(users))
+        return posts, professions
+
+    async def reload_forever(self, db):
+        # Each worker keeps its own counters; periodic reloads pick up
+        # engagement recorded by other workers
+        while True:
+            try:
+                await self.load(db)
+            except Exception:
+                logger.exception("Failed to reload trending posts")
+            await asyncio.sleep(TRENDING_RELOAD_SECONDS)
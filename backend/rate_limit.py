@@ -0,0 +1,146 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+# Default limits per route class as "requests/seconds". Each class can be
+# overridden with RATE_LIMIT_<CLASS>, e.g. RATE_LIMIT_AUTH="5/60".
+DEFAULT_LIMITS = {
+    "auth": "10/60",
+    "search": "60/60",
+    "messages": "30/60",
+    "export": "5/3600",
+}
+
+# Number of proxies in front of the app that append to X-Forwarded-For.
+# Only entries they added can be trusted; anything further left is whatever
+# the client sent.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "1"))
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+def parse_limit(value: str) -> Limit:
+    capacity, _, period = value.partition("/")
+    return Limit(capacity=int(capacity), period=float(period or 60))
+
+
+def load_limits() -> Dict[str, Limit]:
+    limits = {}
+    for route_class, default in DEFAULT_LIMITS.items():
+        limits[route_class] = parse_limit(os.environ.get(f"RATE_LIMIT_{route_class.upper()}", default))
+    return limits
+
+
+class MemoryBucketStore:
+    """Token buckets held in this process. Fine for a single worker.
+
+    Buckets are kept in least-recently-used order and the oldest ones are
+    dropped once there are more than max_keys, so memory stays bounded.
+    """
+
+    MAX_KEYS = 100_000
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.lock = asyncio.Lock()
+
+    async def take(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        async with self.lock:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - last) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class MongoBucketStore:
+    """Token buckets shared by all workers through one atomic update per hit."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.indexed = False
+
+    async def take(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        if not self.indexed:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self.indexed = True
+
+        now = datetime.now(timezone.utc)
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, 1000]}
+        refilled = {"$add": [{"$ifNull": ["$tokens", limit.capacity]}, {"$multiply": [elapsed, limit.rate]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": {"$min": [limit.capacity, refilled]}, "ts": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": now + timedelta(seconds=limit.period),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bucket["allowed"], bucket["tokens"]
+
+
+class RateLimiter:
+    def __init__(self, store, limits: Dict[str, Limit]):
+        self.store = store
+        self.limits = limits
+
+    async def hit(self, route_class: str, key: str):
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return
+        allowed, tokens = await self.store.take(f"{route_class}:{key}", limit)
+        if not allowed:
+            retry_after = max(1, math.ceil((1 - tokens) / limit.rate))
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+
+def create_rate_limiter(db) -> RateLimiter:
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if backend == "mongo":
+        store = MongoBucketStore(db.rate_limits)
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(store, load_limits())
+
+
+def client_ip(request: Request, trusted_proxies: int = TRUSTED_PROXY_COUNT) -> str:
+    # Use the address appended by the outermost trusted proxy; entries to
+    # its left are client-controlled and can't be used as a limiter key
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and trusted_proxies > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return request.client.host if request.client else "unknown"
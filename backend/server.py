@@ -1,18 +1,26 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Request, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import re
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict
-import uuid
+from typing import List, Optional, Dict, Literal
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 from collections import defaultdict
+from rate_limit import create_rate_limiter, client_ip
+from storage import new_id, now, ref, match, match_any, exclude, encode, decode
+from export import stream_export, export_slots, ExportResponse
+from ranking import TrendingIndex, rank_posts
+from message_search import MessageSearch
+from profiling import Profiler, ProfilingMiddleware, LoopMonitor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -27,9 +35,17 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Users allowed to reach the /api/admin routes
+ADMIN_USER_IDS = set(filter(None, os.environ.get('ADMIN_USER_IDS', '').split(',')))
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+rate_limiter = create_rate_limiter(db)
+trending = TrendingIndex()
+message_search = MessageSearch(db)
+profiler = Profiler()
+loop_monitor = LoopMonitor()
 
 # WebSocket connection manager
 class ConnectionManager:
@@ -146,8 +162,25 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
+async def get_admin_user(user_id: str = Depends(get_current_user)):
+    if user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user_id
+
+# Rate limiting dependencies, keyed by client IP or by authenticated user
+def limit_by_ip(route_class: str):
+    async def dependency(request: Request):
+        await rate_limiter.hit(route_class, f"ip:{client_ip(request)}")
+    return dependency
+
+def limit_by_user(route_class: str):
+    async def dependency(user_id: str = Depends(get_current_user)):
+        await rate_limiter.hit(route_class, f"user:{user_id}")
+        return user_id
+    return dependency
+
 # Routes
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[Depends(limit_by_ip("auth"))])
 async def register(user_data: UserRegister):
     # Check if user exists
     existing_user = await db.users.find_one({"$or": [{"email": user_data.email}, {"username": user_data.username}]})
@@ -155,7 +188,7 @@ async def register(user_data: UserRegister):
         raise HTTPException(status_code=400, detail="User with this email or username already exists")
     
     user_dict = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "username": user_data.username,
         "email": user_data.email,
         "password": hash_password(user_data.password),
@@ -164,19 +197,19 @@ async def register(user_data: UserRegister):
         "bio": user_data.bio,
         "location": user_data.location,
         "avatar_url": None,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": now(),
         "connections": [],
         "pending_requests": []
     }
     
-    await db.users.insert_one(user_dict)
+    await db.users.insert_one(encode(user_dict))
     
     token = create_access_token({"sub": user_dict["id"]})
     return {"token": token, "user": User(**{k: v for k, v in user_dict.items() if k != "password"})}
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", dependencies=[Depends(limit_by_ip("auth"))])
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
+    user = decode(await db.users.find_one({"email": credentials.email}))
     if not user or not verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
@@ -185,30 +218,30 @@ async def login(credentials: UserLogin):
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await db.users.find_one({"id": match(user_id)}, {"_id": 0, "password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return decode(user)
 
 @api_router.put("/users/profile", response_model=User)
 async def update_profile(user_update: UserUpdate, user_id: str = Depends(get_current_user)):
     update_data = {k: v for k, v in user_update.model_dump().items() if v is not None}
     if update_data:
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        await db.users.update_one({"id": match(user_id)}, {"$set": update_data})
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-    return user
+    user = await db.users.find_one({"id": match(user_id)}, {"_id": 0, "password": 0})
+    return decode(user)
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await db.users.find_one({"id": match(user_id)}, {"_id": 0, "password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return decode(user)
 
 @api_router.get("/users", response_model=List[User])
-async def get_users(profession: Optional[str] = None, search: Optional[str] = None, user_id: str = Depends(get_current_user)):
-    query = {"id": {"$ne": user_id}}
+async def get_users(profession: Optional[str] = None, search: Optional[str] = None, user_id: str = Depends(limit_by_user("search"))):
+    query = {"id": exclude(user_id)}
     if profession:
         query["profession"] = profession
     if search:
@@ -218,12 +251,12 @@ async def get_users(profession: Optional[str] = None, search: Optional[str] = No
         ]
     
     users = await db.users.find(query, {"_id": 0, "password": 0}).to_list(100)
-    return users
+    return decode(users)
 
 # Connection routes
 @api_router.post("/connections/request")
 async def send_connection_request(request: ConnectionRequest, user_id: str = Depends(get_current_user)):
-    target_user = await db.users.find_one({"id": request.target_user_id})
+    target_user = decode(await db.users.find_one({"id": match(request.target_user_id)}))
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -233,8 +266,8 @@ async def send_connection_request(request: ConnectionRequest, user_id: str = Dep
     
     # Add to pending requests
     await db.users.update_one(
-        {"id": request.target_user_id},
-        {"$addToSet": {"pending_requests": user_id}}
+        {"id": match(request.target_user_id)},
+        {"$addToSet": {"pending_requests": ref(user_id)}}
     )
     
     return {"message": "Connection request sent"}
@@ -243,12 +276,12 @@ async def send_connection_request(request: ConnectionRequest, user_id: str = Dep
 async def accept_connection(requester_id: str, user_id: str = Depends(get_current_user)):
     # Add to both users' connections
     await db.users.update_one(
-        {"id": user_id},
-        {"$pull": {"pending_requests": requester_id}, "$addToSet": {"connections": requester_id}}
+        {"id": match(user_id)},
+        {"$pull": {"pending_requests": match(requester_id)}, "$addToSet": {"connections": ref(requester_id)}}
     )
     await db.users.update_one(
-        {"id": requester_id},
-        {"$addToSet": {"connections": user_id}}
+        {"id": match(requester_id)},
+        {"$addToSet": {"connections": ref(user_id)}}
     )
     
     return {"message": "Connection accepted"}
@@ -256,112 +289,131 @@ async def accept_connection(requester_id: str, user_id: str = Depends(get_curren
 @api_router.post("/connections/reject/{requester_id}")
 async def reject_connection(requester_id: str, user_id: str = Depends(get_current_user)):
     await db.users.update_one(
-        {"id": user_id},
-        {"$pull": {"pending_requests": requester_id}}
+        {"id": match(user_id)},
+        {"$pull": {"pending_requests": match(requester_id)}}
     )
     return {"message": "Connection rejected"}
 
 @api_router.get("/connections/pending", response_model=List[User])
 async def get_pending_requests(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     pending_ids = user.get("pending_requests", [])
     
     if not pending_ids:
         return []
     
-    users = await db.users.find({"id": {"$in": pending_ids}}, {"_id": 0, "password": 0}).to_list(100)
-    return users
+    users = await db.users.find({"id": match_any(pending_ids)}, {"_id": 0, "password": 0}).to_list(100)
+    return decode(users)
 
 @api_router.get("/connections", response_model=List[User])
 async def get_connections(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     connection_ids = user.get("connections", [])
     
     if not connection_ids:
         return []
     
-    users = await db.users.find({"id": {"$in": connection_ids}}, {"_id": 0, "password": 0}).to_list(100)
-    return users
+    users = await db.users.find({"id": match_any(connection_ids)}, {"_id": 0, "password": 0}).to_list(100)
+    return decode(users)
 
 # Post routes
 @api_router.post("/posts", response_model=Post)
 async def create_post(post_data: PostCreate, user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     
     post_dict = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "user_id": user_id,
         "username": user["username"],
         "content": post_data.content,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": now(),
         "likes": [],
         "comments": []
     }
     
-    await db.posts.insert_one(post_dict)
+    await db.posts.insert_one(encode(post_dict))
+    trending.add(post_dict["id"], post_dict["created_at"], user["profession"])
     return Post(**post_dict)
 
 @api_router.get("/posts", response_model=List[Post])
-async def get_posts(user_id: str = Depends(get_current_user)):
+async def get_posts(rank: Optional[Literal["score"]] = None, user_id: str = Depends(get_current_user)):
     # Get posts from user and their connections
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     connection_ids = user.get("connections", []) + [user_id]
     
     posts = await db.posts.find(
-        {"user_id": {"$in": connection_ids}},
+        {"user_id": match_any(connection_ids)},
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
     
+    posts = decode(posts)
+    if rank == "score":
+        posts = rank_posts(posts)
     return posts
 
+@api_router.get("/posts/trending", response_model=List[Post])
+async def get_trending_posts(profession: Optional[str] = None, limit: int = 20, user_id: str = Depends(get_current_user)):
+    post_ids = trending.top(min(max(limit, 1), 100), profession)
+    if not post_ids:
+        return []
+    
+    posts = await db.posts.find({"id": match_any(post_ids)}, {"_id": 0}).to_list(len(post_ids))
+    by_id = {post["id"]: post for post in decode(posts)}
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
 @api_router.post("/posts/{post_id}/like")
 async def like_post(post_id: str, user_id: str = Depends(get_current_user)):
-    post = await db.posts.find_one({"id": post_id})
+    post = decode(await db.posts.find_one({"id": match(post_id)}))
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     if user_id in post.get("likes", []):
-        await db.posts.update_one({"id": post_id}, {"$pull": {"likes": user_id}})
+        await db.posts.update_one({"id": match(post_id)}, {"$pull": {"likes": match(user_id)}})
+        trending.record_like(post_id, -1)
         return {"message": "Post unliked"}
     else:
-        await db.posts.update_one({"id": post_id}, {"$addToSet": {"likes": user_id}})
+        await db.posts.update_one({"id": match(post_id)}, {"$addToSet": {"likes": ref(user_id)}})
+        trending.record_like(post_id, 1)
         return {"message": "Post liked"}
 
 @api_router.post("/posts/{post_id}/comment")
 async def comment_on_post(post_id: str, comment_data: CommentCreate, user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     
     comment = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "user_id": user_id,
         "username": user["username"],
         "content": comment_data.content,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now()
     }
     
-    await db.posts.update_one({"id": post_id}, {"$push": {"comments": comment}})
+    await db.posts.update_one({"id": match(post_id)}, {"$push": {"comments": encode(comment)}})
+    trending.record_comment(post_id)
     return {"message": "Comment added", "comment": comment}
 
 @api_router.delete("/posts/{post_id}")
 async def delete_post(post_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.posts.delete_one({"id": post_id, "user_id": user_id})
+    result = await db.posts.delete_one({"id": match(post_id), "user_id": match(user_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Post not found or unauthorized")
+    trending.remove(post_id)
     return {"message": "Post deleted"}
 
 # Message routes
 @api_router.post("/messages", response_model=Message)
-async def send_message(message_data: MessageCreate, user_id: str = Depends(get_current_user)):
+async def send_message(message_data: MessageCreate, user_id: str = Depends(limit_by_user("messages"))):
     message_dict = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "sender_id": user_id,
         "receiver_id": message_data.receiver_id,
         "content": message_data.content,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": now(),
         "read": False
     }
     
-    await db.messages.insert_one(message_dict)
+    await db.messages.insert_one(encode(message_dict))
+    message_search.on_message(message_dict)
     
     # Send via WebSocket if connected
     await manager.send_personal_message({
@@ -371,41 +423,50 @@ async def send_message(message_data: MessageCreate, user_id: str = Depends(get_c
     
     return Message(**message_dict)
 
+@api_router.get("/messages/search")
+async def search_messages(q: str, offset: int = 0, limit: int = 20, context: int = 0, user_id: str = Depends(limit_by_user("search"))):
+    return await message_search.search(
+        user_id, q,
+        offset=max(offset, 0),
+        limit=min(max(limit, 1), 50),
+        context=min(max(context, 0), 5)
+    )
+
 @api_router.get("/messages/{other_user_id}", response_model=List[Message])
 async def get_messages(other_user_id: str, user_id: str = Depends(get_current_user)):
     messages = await db.messages.find(
         {"$or": [
-            {"sender_id": user_id, "receiver_id": other_user_id},
-            {"sender_id": other_user_id, "receiver_id": user_id}
+            {"sender_id": match(user_id), "receiver_id": match(other_user_id)},
+            {"sender_id": match(other_user_id), "receiver_id": match(user_id)}
         ]},
         {"_id": 0}
     ).sort("created_at", 1).to_list(500)
     
     # Mark as read
     await db.messages.update_many(
-        {"sender_id": other_user_id, "receiver_id": user_id, "read": False},
+        {"sender_id": match(other_user_id), "receiver_id": match(user_id), "read": False},
         {"$set": {"read": True}}
     )
     
-    return messages
+    return decode(messages)
 
 @api_router.get("/messages/unread/count")
 async def get_unread_count(user_id: str = Depends(get_current_user)):
-    count = await db.messages.count_documents({"receiver_id": user_id, "read": False})
+    count = await db.messages.count_documents({"receiver_id": match(user_id), "read": False})
     return {"unread_count": count}
 
 # Dashboard stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id})
+    user = decode(await db.users.find_one({"id": match(user_id)}))
     
     # Get user stats
-    total_posts = await db.posts.count_documents({"user_id": user_id})
+    total_posts = await db.posts.count_documents({"user_id": match(user_id)})
     total_connections = len(user.get("connections", []))
     pending_requests = len(user.get("pending_requests", []))
     
     # Get post engagement
-    user_posts = await db.posts.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    user_posts = await db.posts.find({"user_id": match(user_id)}, {"_id": 0}).to_list(1000)
     total_likes = sum(len(post.get("likes", [])) for post in user_posts)
     total_comments = sum(len(post.get("comments", [])) for post in user_posts)
     
@@ -422,6 +483,63 @@ async def get_dashboard_stats(user_id: str = Depends(get_current_user)):
         "profession": user["profession"]
     }
 
+# Data export
+@api_router.get("/export")
+async def export_data(gzip: bool = False, user_id: str = Depends(get_current_user)):
+    # Reserve a slot before spending a rate limit token, so a busy worker
+    # doesn't use up the user's export allowance
+    release = export_slots.try_acquire()
+    if release is None:
+        raise HTTPException(status_code=429, detail="Too many exports in progress", headers={"Retry-After": "30"})
+    try:
+        await rate_limiter.hit("export", f"user:{user_id}")
+    except Exception:
+        release()
+        raise
+
+    filename = "export.ndjson.gz" if gzip else "export.ndjson"
+    return ExportResponse(
+        stream_export(db, user_id, compress=gzip),
+        release,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Admin profiling
+@api_router.post("/admin/profile")
+async def capture_profile(seconds: float = 10, mode: Literal["sample", "cprofile"] = "sample", route: Optional[str] = None, output_format: Literal["text", "pstats"] = Query("text", alias="format"), user_id: str = Depends(get_admin_user)):
+    if route:
+        try:
+            re.compile(route)
+        except re.error:
+            raise HTTPException(status_code=400, detail="Invalid route pattern")
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    
+    raw = mode == "cprofile" and output_format == "pstats"
+    result = await profiler.capture(seconds, mode, route, raw=raw)
+    if result is None:
+        return PlainTextResponse("No profile data collected" + (f" (no request matched {route!r})" if route else ""))
+    if raw:
+        return Response(
+            result,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="profile.pstats"'}
+        )
+    return PlainTextResponse(result)
+
+@api_router.get("/admin/loop")
+async def get_loop_report(user_id: str = Depends(get_admin_user)):
+    return loop_monitor.report()
+
+@api_router.post("/admin/loop")
+async def set_loop_monitor(enabled: bool, user_id: str = Depends(get_admin_user)):
+    if enabled:
+        loop_monitor.start()
+    else:
+        loop_monitor.stop()
+    return loop_monitor.report()
+
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
@@ -434,6 +552,8 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
 
 app.include_router(api_router)
 
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -448,6 +568,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.trending_task = asyncio.create_task(trending.reload_forever(db))
+    if os.environ.get('LOOP_MONITOR') == '1':
+        loop_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List
+
+from bson.binary import Binary, UuidRepresentation
+
+# Storage format for new writes and queries.
+#   "string"  - ids as 36-char UUID strings, timestamps as ISO strings (legacy)
+#   "compact" - ids as 16-byte BSON binary UUIDs, timestamps as BSON dates
+# The API always exposes the string form. In compact mode queries also match
+# legacy values, so the flag can be flipped before migrate_storage.py runs.
+STORAGE_FORMAT = os.environ.get("STORAGE_FORMAT", "string")
+COMPACT = STORAGE_FORMAT == "compact"
+
+REF_FIELDS = {"id", "user_id", "sender_id", "receiver_id"}
+REF_LIST_FIELDS = {"connections", "pending_requests", "likes"}
+DATE_FIELDS = {"created_at"}
+
+
+def new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Single values
+def compact_ref(value):
+    if isinstance(value, str):
+        try:
+            return Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+        except ValueError:
+            # Not a UUID (e.g. a malformed path parameter); keep it as is
+            return value
+    return value
+
+
+def compact_date(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def ref(value: str):
+    return compact_ref(value) if COMPACT else value
+
+
+def match(value: str):
+    """Query condition for one reference, matching both stored forms."""
+    if COMPACT:
+        return {"$in": [compact_ref(value), value]}
+    return value
+
+
+def match_any(values: Iterable[str]) -> dict:
+    values = list(values)
+    if COMPACT:
+        return {"$in": [compact_ref(v) for v in values] + values}
+    return {"$in": values}
+
+
+def exclude(value: str) -> dict:
+    if COMPACT:
+        return {"$nin": [compact_ref(value), value]}
+    return {"$ne": value}
+
+
+def since(field: str, value: str) -> dict:
+    """Range condition on a date field, matching both stored forms."""
+    return {"$or": [{field: {"$gte": value}}, {field: {"$gte": compact_date(value)}}]}
+
+
+# Whole documents
+def encode(doc: dict, compact: bool = None) -> dict:
+    """Convert an API-form document into its stored form."""
+    if not (COMPACT if compact is None else compact):
+        return dict(doc)
+    stored = {}
+    for key, value in doc.items():
+        if key in REF_FIELDS:
+            value = compact_ref(value)
+        elif key in REF_LIST_FIELDS:
+            value = dedupe([compact_ref(v) for v in value])
+        elif key in DATE_FIELDS:
+            value = compact_date(value)
+        elif key == "comments":
+            value = [encode(c, compact=True) for c in value]
+        stored[key] = value
+    return stored
+
+
+def decode(doc):
+    """Convert a stored document (either form) back into the API form."""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [decode(d) for d in doc]
+    api = {}
+    for key, value in doc.items():
+        if key in REF_LIST_FIELDS:
+            value = dedupe([decode_value(v) for v in value])
+        elif key == "comments":
+            value = [decode(c) for c in value]
+        else:
+            value = decode_value(value)
+        api[key] = value
+    return api
+
+
+def decode_value(value):
+    if isinstance(value, Binary) and value.subtype == 4:
+        return str(value.as_uuid(UuidRepresentation.STANDARD))
+    if isinstance(value, datetime):
+        # PyMongo returns naive UTC datetimes
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def dedupe(values: List) -> List:
+    seen = set()
+    result = []
+    for v in values:
+        if v not in seen:
+            seen.add(v)
+            result.append(v)
+    return result
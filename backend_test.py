@@ -171,6 +171,22 @@ class ProfNetworkAPITester:
         )
         return response is not None
 
+    def test_get_trending_posts(self):
+        """Test trending posts and ranked feed"""
+        trending = self.run_test(
+            "Get Trending Posts",
+            "GET",
+            "posts/trending",
+            200
+        )
+        ranked = self.run_test(
+            "Get Ranked Feed",
+            "GET",
+            "posts?rank=score",
+            200
+        )
+        return trending is not None and ranked is not None
+
     def test_like_post(self):
         """Test liking a post"""
         if not hasattr(self, 'test_post_id'):
@@ -269,6 +285,29 @@ class ProfNetworkAPITester:
         )
         return response is not None
 
+    def test_export_data(self):
+        """Test streaming data export"""
+        url = f"{self.base_url}/export"
+        try:
+            response = requests.get(url, headers={'Authorization': f'Bearer {self.token}'}, stream=True)
+            lines = [json.loads(line) for line in response.iter_lines() if line]
+            success = response.status_code == 200 and bool(lines) and lines[0]["type"] == "user"
+            self.log_test("Export Data", success, f"Status: {response.status_code}, Records: {len(lines)}")
+            return success
+        except Exception as e:
+            self.log_test("Export Data", False, f"Exception: {str(e)}")
+            return False
+
+    def test_search_messages(self):
+        """Test searching message history"""
+        response = self.run_test(
+            "Search Messages",
+            "GET",
+            "messages/search?q=hello",
+            200
+        )
+        return response is not None and 'results' in response
+
     def test_delete_post(self):
         """Test deleting a post"""
         if not hasattr(self, 'test_post_id'):
@@ -309,6 +348,7 @@ class ProfNetworkAPITester:
         self.test_get_posts()
         self.test_like_post()
         self.test_comment_on_post()
+        self.test_get_trending_posts()
         
         # User Discovery Tests
         print("\n🔍 Testing User Discovery...")
@@ -327,6 +367,11 @@ class ProfNetworkAPITester:
         # Message Tests
         print("\n💬 Testing Messages...")
         self.test_get_messages_count()
+        self.test_search_messages()
+        
+        # Export Tests
+        print("\n📦 Testing Export...")
+        self.test_export_data()
         
         # Cleanup Tests
         print("\n🧹 Testing Cleanup...")
@@ -0,0 +1,143 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules are imported flat, as uvicorn does when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+# In-memory stand-ins for the parts of Motor/PyMongo the backend uses. Queries
+# support equality (including array membership), $in, $gt, $gte, $and and $or;
+# projections are ignored, so tests store documents in the shape they expect
+# back.
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif not matches_value(doc.get(field), condition):
+            return False
+    return True
+
+
+def matches_value(value, condition) -> bool:
+    if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+        for op, operand in condition.items():
+            if op == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(v in operand for v in values):
+                    return False
+            elif op in ("$gt", "$gte"):
+                # Like MongoDB, range operators only compare values of one type
+                if value is None or type(value) is not type(operand):
+                    return False
+                if value < operand or (op == "$gt" and value == operand):
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+class FakeCursor:
+    def __init__(self, docs, on_fetch=None):
+        self.docs = docs
+        self.on_fetch = on_fetch
+
+    def sort(self, key, direction=1):
+        return FakeCursor(sorted(self.docs, key=lambda d: d[key], reverse=direction == -1), self.on_fetch)
+
+    def limit(self, n):
+        return FakeCursor(self.docs[:n] if n else self.docs, self.on_fetch)
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for doc in self.docs:
+            yield doc
+
+    async def to_list(self, length):
+        if self.on_fetch:
+            self.on_fetch()
+        return list(self.docs if length is None else self.docs[:length])
+
+
+class FakeResult:
+    def __init__(self, matched=0, modified=0, inserted_ids=()):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.inserted_ids = list(inserted_ids)
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+        self.indexes = []
+        # Called whenever a cursor's to_list runs, to simulate concurrent work
+        self.on_fetch = None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([dict(d) for d in self.docs if matches(d, query or {})], self.on_fetch)
+
+    async def find_one(self, query=None, projection=None):
+        return next((dict(d) for d in self.docs if matches(d, query or {})), None)
+
+    def insert_many(self, docs, ordered=True):
+        self.docs.extend(dict(d) for d in docs)
+        return FakeResult(inserted_ids=range(len(docs)))
+
+    def bulk_write(self, ops, ordered=True):
+        matched = 0
+        for op in ops:
+            for doc in self.docs:
+                if matches(doc, op._filter):
+                    matched += 1
+                    self._apply(doc, op._doc)
+                    break
+        return FakeResult(matched=matched, modified=matched)
+
+    def _apply(self, doc, update):
+        for op, fields in update.items():
+            for field, value in fields.items():
+                if op == "$set":
+                    doc[field] = value
+                elif op == "$addToSet":
+                    values = value["$each"] if isinstance(value, dict) else [value]
+                    target = doc.setdefault(field, [])
+                    target.extend(v for v in values if v not in target)
+                else:
+                    raise NotImplementedError(op)
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name == "collections":
+            raise AttributeError(name)
+        return self[name]
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
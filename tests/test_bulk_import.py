@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from bulk_import import UserIds, created_at, import_connections, import_posts, new_user_rows, user_doc
+
+
+def row(username, email, **extra):
+    return dict({"username": username, "email": email, "password": "secret"}, **extra)
+
+
+def test_duplicates_in_file_and_db_are_rejected():
+    taken_usernames, taken_emails = {"existing"}, {"taken@example.com"}
+    batch = [
+        row("alice", "alice@example.com"),
+        row("alice", "other@example.com"),
+        row("bob", "alice@example.com"),
+        row("existing", "new@example.com"),
+        row("carol", "taken@example.com"),
+        row("dave", "dave@example.com"),
+    ]
+    rows, rejected = new_user_rows(batch, taken_usernames, taken_emails)
+    assert [r["username"] for r in rows] == ["alice", "dave"]
+    assert rejected == 4
+
+    # A later batch can't reuse what this one accepted
+    rows, rejected = new_user_rows([row("dave", "dave2@example.com")], taken_usernames, taken_emails)
+    assert rows == [] and rejected == 1
+
+
+def test_rows_without_credentials_are_rejected():
+    batch = [
+        {"username": "eve", "email": "eve@example.com", "password": None},
+        {"username": "", "email": "x@example.com", "password": "secret"},
+        {"username": "frank", "email": "frank@example.com", "password_hash": "$2b$12$hash"},
+    ]
+    rows, rejected = new_user_rows(batch, set(), set())
+    assert [r["username"] for r in rows] == ["frank"]
+    assert rejected == 2
+
+
+def test_missing_csv_columns_become_empty_strings():
+    doc = user_doc(row("alice", "alice@example.com", full_name=None, profession=None, bio=None, location=None), "hash")
+    assert doc["full_name"] == doc["profession"] == doc["bio"] == doc["location"] == ""
+    assert doc["password"] == "hash"
+    assert doc["id"] and doc["created_at"]
+
+
+def write_ndjson(path, rows):
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows))
+    return str(path)
+
+
+def seed_users(db, user_ids):
+    db.users.docs = [{"id": uid, "username": name, "connections": []} for uid, name in
+                     (("id-ada", "ada"), ("id-bob", "bob"), ("id-cy", "cy"))]
+    # Users imported in this run are already cached; the rest are looked up
+    user_ids.add("ada", "id-ada")
+
+
+def test_connections_are_stored_on_both_sides(fake_db, tmp_path):
+    user_ids = UserIds(fake_db)
+    seed_users(fake_db, user_ids)
+    path = write_ndjson(tmp_path / "edges.ndjson", [
+        {"user": "ada", "other": "bob"},
+        {"user": "id-cy", "other": "id-ada"},
+        {"user": "bob", "other": "bob"},
+        {"user": "ada", "other": "nobody"},
+    ])
+    progress = import_connections(fake_db, path, user_ids, batch_size=10)
+    connections = {u["username"]: sorted(u["connections"]) for u in fake_db.users.docs}
+    assert connections == {"ada": ["id-bob", "id-cy"], "bob": ["id-ada"], "cy": ["id-ada"]}
+    assert progress.rows == 2
+    assert progress.errors == 2
+
+
+def test_posts_with_bad_dates_or_unknown_authors_are_skipped(fake_db, tmp_path):
+    user_ids = UserIds(fake_db)
+    seed_users(fake_db, user_ids)
+    # Cached by an earlier batch whose insert failed, so not in the database
+    user_ids.add("ghost", "id-ghost")
+    path = write_ndjson(tmp_path / "posts.ndjson", [
+        {"user": "bob", "content": "one", "created_at": "2024-01-02T03:04:05"},
+        {"user": "id-ada", "content": "two", "created_at": "2024-01-02T05:04:05+02:00"},
+        {"user": "bob", "content": "bad", "created_at": "yesterday"},
+        {"user": "ghost", "content": "orphan"},
+        {"user": "nobody", "content": "unknown"},
+    ])
+    progress = import_posts(fake_db, path, user_ids, batch_size=10)
+    posts = [(p["username"], p["content"], p["created_at"]) for p in fake_db.posts.docs]
+    assert posts == [
+        ("bob", "one", "2024-01-02T03:04:05+00:00"),
+        ("ada", "two", "2024-01-02T03:04:05+00:00"),
+    ]
+    assert progress.rows == 2
+    assert progress.errors == 3
+
+
+def test_created_at_is_normalised_to_utc():
+    assert created_at("2024-01-02T03:04:05Z") == "2024-01-02T03:04:05+00:00"
+    assert created_at(None).endswith("+00:00")
+    with pytest.raises(ValueError):
+        created_at("02/01/2024")
@@ -0,0 +1,108 @@
+import asyncio
+import gzip
+import json
+from types import SimpleNamespace
+
+import export
+from export import ExportSlots, ExportResponse, EXPORT_CHUNK_BYTES, stream_export
+
+
+def seed(db, posts=2, content="hello"):
+    db.users.docs = [
+        {"id": "u1", "username": "ada", "connections": ["u2"], "pending_requests": ["u3"]},
+        {"id": "u2", "username": "bob"},
+        {"id": "u3", "username": "cy"},
+    ]
+    db.posts.docs = [
+        {"id": f"p{i}", "user_id": "u1", "content": content, "created_at": f"2024-01-0{i + 1}T00:00:00+00:00"}
+        for i in reversed(range(posts))
+    ]
+    db.messages.docs = [
+        {"id": "m1", "sender_id": "u2", "receiver_id": "u1", "content": "hi", "created_at": "2024-01-01T00:00:00+00:00"},
+        {"id": "m2", "sender_id": "u3", "receiver_id": "u2", "content": "not mine", "created_at": "2024-01-02T00:00:00+00:00"},
+    ]
+
+
+def collect(db, **kwargs):
+    async def run():
+        return [chunk async for chunk in stream_export(db, "u1", **kwargs)]
+    return asyncio.run(run())
+
+
+def test_gzip_export_decodes_to_records_in_order(fake_db):
+    seed(fake_db)
+    chunks = collect(fake_db, compress=True, rate=0)
+    lines = gzip.decompress(b"".join(chunks)).decode("utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["type"] for r in records] == ["user", "connection", "pending_request", "post", "post", "message"]
+    assert records[0]["data"]["username"] == "ada"
+    assert records[1]["data"]["id"] == "u2"
+    assert records[2]["data"]["id"] == "u3"
+    assert [r["data"]["id"] for r in records[3:5]] == ["p0", "p1"]
+    assert records[5]["data"]["id"] == "m1"
+
+
+def test_unknown_user_exports_nothing(fake_db):
+    assert collect(fake_db, rate=0) == []
+
+
+def test_chunks_are_at_least_chunk_size_except_the_last(fake_db):
+    seed(fake_db, posts=9, content="x" * 20000)
+    chunks = collect(fake_db, rate=0)
+    assert len(chunks) > 1
+    assert all(len(chunk) >= EXPORT_CHUNK_BYTES for chunk in chunks[:-1])
+    assert len(b"".join(chunks).splitlines()) == 1 + 2 + 9 + 1
+
+
+def test_stream_is_throttled_to_rate(fake_db, monkeypatch):
+    seed(fake_db)
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(export, "asyncio", SimpleNamespace(sleep=sleep))
+    size = len(b"".join(collect(fake_db, rate=100)))
+    # One chunk of `size` bytes at 100 bytes/sec should wait about size/100
+    assert len(slept) == 1
+    assert 0 < slept[0] <= size / 100
+
+
+def test_export_slots_reserve_up_to_limit():
+    slots = ExportSlots(limit=2)
+    release = slots.try_acquire()
+    assert release
+    assert slots.try_acquire()
+    assert slots.try_acquire() is None
+    release()
+    assert slots.try_acquire()
+
+
+def test_export_slot_release_is_idempotent():
+    slots = ExportSlots(limit=2)
+    release = slots.try_acquire()
+    slots.try_acquire()
+    release()
+    release()
+    assert slots.active == 1
+
+
+def test_slot_released_when_stream_is_abandoned():
+    slots = ExportSlots(limit=1)
+    started = []
+
+    async def body():
+        started.append(True)
+        yield b"never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # The client is gone; the response start never completes
+        await asyncio.Event().wait()
+
+    response = ExportResponse(body(), slots.try_acquire())
+    asyncio.run(response({"type": "http"}, receive, send))
+    assert not started
+    assert slots.active == 0
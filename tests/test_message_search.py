@@ -0,0 +1,92 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from message_search import MessageSearch, UserMessageIndex
+
+ALICE = str(uuid.uuid4())
+BOB = str(uuid.uuid4())
+CAROL = str(uuid.uuid4())
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def message(sender, receiver, content, minutes):
+    return {
+        "id": str(uuid.uuid4()),
+        "sender_id": sender,
+        "receiver_id": receiver,
+        "content": content,
+        "created_at": (BASE + timedelta(minutes=minutes)).isoformat(),
+        "read": False,
+    }
+
+
+def test_index_ranks_and_returns_context():
+    index = UserMessageIndex()
+    msgs = [
+        message(ALICE, BOB, "hello world", 0),
+        message(BOB, ALICE, "world cup final", 1),
+        message(ALICE, CAROL, "hello there world", 2),
+    ]
+    for m in msgs:
+        index.add(m, ALICE)
+
+    total, hits = index.search(["hello", "world"], 0, 10)
+    assert total == 2
+    assert [index.ids[doc] for _, doc in hits] == [msgs[2]["id"], msgs[0]["id"]]
+    assert index.context(0, 1) == [0, 1]
+    assert index.search(["missing"], 0, 10) == (0, [])
+
+
+def test_context_follows_created_at_when_indexed_out_of_order():
+    index = UserMessageIndex()
+    t0, t2, t3, t4 = (message(ALICE, BOB, f"note {m}", m) for m in (0, 2, 3, 4))
+    for m in (t0, t3, t2, t4):
+        index.add(m, ALICE)
+
+    hit = index.ids.index(t2["id"])
+    assert [index.ids[d] for d in index.context(hit, 1)] == [t0["id"], t2["id"], t3["id"]]
+
+
+def test_ties_favour_newer_message_not_index_order():
+    index = UserMessageIndex()
+    newer = message(ALICE, BOB, "hello", 5)
+    older = message(ALICE, BOB, "hello", 1)
+    index.add(newer, ALICE)
+    index.add(older, ALICE)
+
+    _, hits = index.search(["hello"], 0, 2)
+    assert [index.ids[doc] for _, doc in hits] == [newer["id"], older["id"]]
+
+
+def test_catch_up_includes_older_message_from_another_worker(fake_db):
+    db = fake_db
+    search = MessageSearch(db)
+
+    async def run():
+        # Alice has searched before, so her index is loaded on this worker
+        db.messages.docs.append(message(BOB, ALICE, "first hello", 0))
+        await search.search(ALICE, "hello")
+
+        # Another worker stores a message at t1, then this worker sends one
+        # at t2 > t1 which goes straight into the loaded index
+        other_worker = message(CAROL, ALICE, "hello from carol", 10)
+        this_worker = message(ALICE, BOB, "hello again", 11)
+        db.messages.docs.extend([other_worker, this_worker])
+        search.on_message(this_worker)
+
+        return other_worker, await search.search(ALICE, "hello")
+
+    other_worker, result = asyncio.run(run())
+    found = [r["message"]["id"] for r in result["results"]]
+    assert other_worker["id"] in found
+    assert result["total"] == 3
+    assert [("sender_id", 1), ("created_at", 1)] in db.messages.indexes
+    assert [("receiver_id", 1), ("created_at", 1)] in db.messages.indexes
+
+
+def test_search_is_scoped_to_the_caller(fake_db):
+    db = fake_db
+    db.messages.docs.append(message(BOB, CAROL, "secret hello", 0))
+    result = asyncio.run(MessageSearch(db).search(ALICE, "hello"))
+    assert result == {"total": 0, "results": []}
@@ -0,0 +1,43 @@
+import asyncio
+import marshal
+
+from profiling import Profiler
+
+
+async def busy(stop):
+    while not stop.is_set():
+        sum(range(2000))
+        await asyncio.sleep(0)
+
+
+def capture(**kwargs):
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(busy(stop))
+        try:
+            return await Profiler().capture(0.2, **kwargs)
+        finally:
+            stop.set()
+            await task
+
+    return asyncio.run(run())
+
+
+def test_cprofile_text_report():
+    assert "function calls" in capture(mode="cprofile", route=None)
+
+
+def test_cprofile_raw_dump_is_loadable():
+    stats = marshal.loads(capture(mode="cprofile", route=None, raw=True))
+    assert stats
+
+
+def test_sample_collapsed_stacks():
+    out = capture(mode="sample", route=None)
+    assert out.strip().rsplit(" ", 1)[1].isdigit()
+
+
+def test_unmatched_route_returns_none():
+    assert capture(mode="cprofile", route="^/api/nothing$") is None
+    assert capture(mode="cprofile", route="^/api/nothing$", raw=True) is None
+    assert capture(mode="sample", route="^/api/nothing$") is None
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from ranking import TrendingIndex, rank_posts
+
+
+def ago(hours):
+    return (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+
+
+def test_top_orders_by_decayed_engagement_and_profession():
+    index = TrendingIndex(capacity=10)
+    index.add("old-popular", ago(48), "Engineer", likes=10)
+    index.add("new-liked", ago(1), "Engineer", likes=5)
+    index.add("new-quiet", ago(0), "Doctor")
+    index.add("expired", ago(1000), "Doctor", likes=100)
+
+    assert index.top(10) == ["new-liked", "new-quiet", "old-popular"]
+    assert index.top(10, "Doctor") == ["new-quiet"]
+    assert index.top(10, "Unknown") == []
+
+
+def test_full_window_evicts_lowest_score():
+    index = TrendingIndex(capacity=2)
+    index.add("a", ago(1), "", likes=5)
+    index.add("b", ago(1), "")
+    index.add("c", ago(0), "", likes=1)
+    assert sorted(index.top(10)) == ["a", "c"]
+
+
+def test_load_keeps_updates_recorded_while_awaiting(fake_db):
+    index = TrendingIndex(capacity=10)
+    created = ago(1)
+    index.add("p1", created, "Engineer")
+
+    def concurrent_updates():
+        index.record_like("p1", 1)
+        index.record_comment("p1")
+        index.add("p2", ago(0), "Doctor")
+
+    fake_db.posts.docs = [{"id": "p1", "user_id": "u1", "created_at": created, "like_count": 3, "comment_count": 0}]
+    fake_db.posts.on_fetch = concurrent_updates
+    fake_db.users.docs = [{"id": "u1", "profession": "Engineer"}]
+    asyncio.run(index.load(fake_db))
+
+    slot = index.slots["p1"]
+    assert index.likes[slot] == 4
+    assert index.comments[slot] == 1
+    assert "p2" in index.slots
+    assert index._pending is None
+
+
+def test_rank_posts_prefers_engagement_at_same_age():
+    now = datetime.now(timezone.utc).isoformat()
+    posts = [{"id": 1, "created_at": now}, {"id": 2, "created_at": now, "likes": ["u"]}]
+    assert [p["id"] for p in rank_posts(posts)] == [2, 1]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from rate_limit import Limit, MemoryBucketStore, RateLimiter, client_ip, parse_limit
+
+
+def make_request(forwarded=None, host="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (host, 1234)})
+
+
+def test_parse_limit():
+    assert parse_limit("5/60") == Limit(capacity=5, period=60.0)
+
+
+def test_limiter_returns_429_with_retry_after():
+    limiter = RateLimiter(MemoryBucketStore(), {"auth": Limit(capacity=2, period=60)})
+
+    async def run():
+        await limiter.hit("auth", "ip:1.2.3.4")
+        await limiter.hit("auth", "ip:1.2.3.4")
+        with pytest.raises(HTTPException) as exc:
+            await limiter.hit("auth", "ip:1.2.3.4")
+        # Other keys have their own bucket
+        await limiter.hit("auth", "ip:5.6.7.8")
+        return exc.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+
+
+def test_unlimited_route_class_is_ignored():
+    limiter = RateLimiter(MemoryBucketStore(), {})
+    asyncio.run(limiter.hit("other", "ip:1.2.3.4"))
+
+
+def test_memory_store_is_bounded_lru():
+    store = MemoryBucketStore(max_keys=3)
+    limit = Limit(capacity=1, period=3600)
+
+    async def run():
+        await store.take("a", limit)
+        await store.take("b", limit)
+        await store.take("c", limit)
+        await store.take("a", limit)
+        await store.take("d", limit)
+
+    asyncio.run(run())
+    assert list(store.buckets) == ["c", "a", "d"]
+
+
+def test_client_ip_uses_rightmost_trusted_hop():
+    request = make_request("6.6.6.6, 203.0.113.7")
+    assert client_ip(request, trusted_proxies=1) == "203.0.113.7"
+    assert client_ip(request, trusted_proxies=2) == "6.6.6.6"
+
+
+def test_client_ip_falls_back_to_peer_address():
+    assert client_ip(make_request()) == "10.0.0.1"
+    assert client_ip(make_request("203.0.113.7"), trusted_proxies=2) == "10.0.0.1"
+    assert client_ip(make_request("203.0.113.7"), trusted_proxies=0) == "10.0.0.1"
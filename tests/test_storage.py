@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime
+
+from bson.binary import Binary, UuidRepresentation
+
+import storage
+from migrate_storage import migrate_collection
+
+USER_ID = str(uuid.uuid4())
+OTHER_ID = str(uuid.uuid4())
+CREATED_AT = "2024-05-01T12:30:00.123000+00:00"
+
+
+def binary(value):
+    return Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+
+
+def make_post():
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": USER_ID,
+        "username": "alice",
+        "content": "hello",
+        "created_at": CREATED_AT,
+        "likes": [USER_ID, OTHER_ID],
+        "comments": [{
+            "id": str(uuid.uuid4()),
+            "user_id": OTHER_ID,
+            "username": "bob",
+            "content": "hi",
+            "created_at": CREATED_AT,
+        }],
+    }
+
+
+def test_compact_round_trip():
+    post = make_post()
+    stored = storage.encode(post, compact=True)
+
+    assert stored["user_id"] == binary(USER_ID)
+    assert stored["likes"] == [binary(USER_ID), binary(OTHER_ID)]
+    assert isinstance(stored["created_at"], datetime)
+    assert stored["comments"][0]["user_id"] == binary(OTHER_ID)
+    assert isinstance(stored["comments"][0]["created_at"], datetime)
+    assert storage.decode(stored) == post
+
+
+def test_decode_naive_datetime_as_utc():
+    stored = {"created_at": datetime(2024, 5, 1, 12, 30)}
+    assert storage.decode(stored)["created_at"] == "2024-05-01T12:30:00+00:00"
+
+
+def test_mixed_form_lists_are_deduplicated():
+    stored = {"connections": [USER_ID, binary(USER_ID), binary(OTHER_ID)]}
+    assert storage.encode(stored, compact=True)["connections"] == [binary(USER_ID), binary(OTHER_ID)]
+    assert storage.decode(stored)["connections"] == [USER_ID, OTHER_ID]
+
+
+def test_encode_is_idempotent():
+    once = storage.encode(make_post(), compact=True)
+    assert storage.encode(once, compact=True) == once
+
+
+def test_string_mode_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(storage, "COMPACT", False)
+    post = make_post()
+    assert storage.encode(post) == post
+    assert storage.encode(post) is not post
+    assert storage.decode(post) == post
+    assert storage.ref(USER_ID) == USER_ID
+    assert storage.match(USER_ID) == USER_ID
+    assert storage.match_any([USER_ID]) == {"$in": [USER_ID]}
+    assert storage.exclude(USER_ID) == {"$ne": USER_ID}
+
+
+def test_compact_queries_match_both_forms(monkeypatch):
+    monkeypatch.setattr(storage, "COMPACT", True)
+    assert storage.ref(USER_ID) == binary(USER_ID)
+    assert storage.match(USER_ID) == {"$in": [binary(USER_ID), USER_ID]}
+    assert storage.match_any([USER_ID]) == {"$in": [binary(USER_ID), USER_ID]}
+    assert storage.exclude(USER_ID) == {"$nin": [binary(USER_ID), USER_ID]}
+
+
+def test_non_uuid_refs_are_kept():
+    assert storage.compact_ref("not-a-uuid") == "not-a-uuid"
+
+
+def test_migration_is_idempotent_and_skips_bad_dates(fake_db):
+    good = dict(make_post(), _id=1)
+    bad = dict(make_post(), _id=2, created_at="last tuesday")
+    collection = fake_db.posts
+    collection.docs = [good, bad]
+
+    first = migrate_collection(collection, batch_size=1, dry_run=False)
+    assert first["converted"] == 1
+    assert first["errors"] == 1
+    assert first["bytes_after"] < first["bytes_before"]
+    assert collection.docs[0]["user_id"] == binary(USER_ID)
+    assert collection.docs[1]["created_at"] == "last tuesday"
+
+    second = migrate_collection(collection, batch_size=1, dry_run=False)
+    assert second["converted"] == 0
+    assert second["errors"] == 1